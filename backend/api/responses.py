@@ -0,0 +1,99 @@
+# backend/api/responses.py
+import gzip
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from flask import Response, current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bodies smaller than this are sent uncompressed
+COMPRESSION_THRESHOLD = 1024
+# Total size of compressed bodies kept in memory per process
+MAX_CACHED_BYTES = 16 * 1024 * 1024
+# Quality 11 (the default) takes seconds on multi-MB results; 5 is close to gzip in speed
+BROTLI_QUALITY = 5
+
+ETAG_SUFFIXES = {'identity': '', 'gzip': '-gz', 'br': '-br'}
+
+# (digest, encoding) -> compressed bytes, least recent first
+_encoded_bodies = OrderedDict()
+_encoded_bytes = 0
+_encoded_bodies_lock = threading.Lock()
+
+def _choose_encoding(body_size):
+    """Pick the best content encoding the client accepts"""
+    if body_size < COMPRESSION_THRESHOLD:
+        return 'identity'
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return 'identity'
+
+def _encode(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY, mode=brotli.MODE_TEXT)
+    # mtime=0 keeps the gzip header, and so the bytes behind a strong ETag, identical
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+def _get_encoded_body(digest, body, encoding):
+    """Return body in the given encoding, compressing at most once per digest"""
+    global _encoded_bytes
+    if encoding == 'identity':
+        return body
+    key = (digest, encoding)
+    with _encoded_bodies_lock:
+        encoded = _encoded_bodies.get(key)
+        if encoded is not None:
+            _encoded_bodies.move_to_end(key)
+            return encoded
+
+    encoded = _encode(body, encoding)
+    if len(encoded) > MAX_CACHED_BYTES:
+        return encoded
+    with _encoded_bodies_lock:
+        if key not in _encoded_bodies:
+            _encoded_bodies[key] = encoded
+            _encoded_bytes += len(encoded)
+            while _encoded_bytes > MAX_CACHED_BYTES:
+                _, evicted = _encoded_bodies.popitem(last=False)
+                _encoded_bytes -= len(evicted)
+    return encoded
+
+def cached_json_response(payload, status=200):
+    """Build a JSON response with a strong ETag and optional compression.
+
+    Answers 304 when If-None-Match already holds the ETag, and serves gzip or
+    brotli for large bodies, reusing the compressed bytes for identical results.
+    """
+    body = current_app.json.dumps(payload).encode('utf-8')
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    encoding = _choose_encoding(len(body))
+    # Each encoding is a different representation, so it gets its own ETag
+    etag = digest + ETAG_SUFFIXES[encoding]
+
+    # If-None-Match uses weak comparison (RFC 9110), so W/"<etag>" also matches
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(
+            _get_encoded_body(digest, body, encoding),
+            status=status,
+            mimetype='application/json'
+        )
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+            logger.debug(f"Compressed {len(body)} byte response with {encoding} to {response.content_length}")
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
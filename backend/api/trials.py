@@ -5,47 +5,250 @@ import os
 import json
 import time
 import pickle
+import threading
 from dotenv import load_dotenv
 import random
+import re
 import hashlib
 from datetime import datetime, timedelta
 from math import radians, sin, cos, sqrt, atan2
 
-# Load environment variables
-load_dotenv()
-
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Google Maps API Key
-GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY', '')
-if not GOOGLE_MAPS_API_KEY:
-    logger.warning("No Google Maps API key found in environment variables")
+# Google Maps API Key (populated by load_environment)
+GOOGLE_MAPS_API_KEY = ''
+_environment_loaded = False
 
-# Persistent geocoding cache
+# Persistent geocoding cache, mapped lazily on first use
 CACHE_FILE = os.path.join(os.path.dirname(__file__), 'geocoding_cache.pkl')
-geocoding_cache = {}
-
-# Load cached geocoding results
-try:
-    if os.path.exists(CACHE_FILE) and os.path.getsize(CACHE_FILE) > 0:
-        with open(CACHE_FILE, 'rb') as f:
-            geocoding_cache = pickle.load(f)
-            logger.debug(f"Loaded {len(geocoding_cache)} cached locations")
-except Exception as e:
-    logger.warning(f"Failed to load geocoding cache: {e}")
-
-def save_geocoding_cache():
-    """Save geocoding cache to disk"""
-    try:
-        with open(CACHE_FILE, 'wb') as f:
-            pickle.dump(geocoding_cache, f)
-    except Exception as e:
-        logger.warning(f"Failed to save geocoding cache: {e}")
+_geocoding_cache = None
+_geocoding_cache_lock = threading.Lock()
+_geocoding_cache_save_lock = threading.Lock()
+# Set when entries are added or removed; saves are skipped otherwise so a
+# worker never walks (and copies) the preloaded cache pages just to rewrite them
+_geocoding_cache_dirty = False
+
+# Timings and sizes recorded while initializing, exposed via /api/metrics
+startup_metrics = {
+    'gunicorn_preload': False,
+    'eager_cache': False,
+    'env_load_ms': None,
+    'cache_load_ms': None,
+    'cache_clean_ms': None,
+    'cache_entries': 0,
+    'cache_loaded_pid': None
+}
+
+# Geocode cache lookups since process start, exposed via /api/metrics
+geocode_cache_stats = {
+    'hits': 0,
+    'misses': 0
+}
+
+STATE_ABBREVIATIONS = {
+    'alabama': 'al', 'alaska': 'ak', 'arizona': 'az', 'arkansas': 'ar', 'california': 'ca',
+    'colorado': 'co', 'connecticut': 'ct', 'delaware': 'de', 'florida': 'fl', 'georgia': 'ga',
+    'hawaii': 'hi', 'idaho': 'id', 'illinois': 'il', 'indiana': 'in', 'iowa': 'ia',
+    'kansas': 'ks', 'kentucky': 'ky', 'louisiana': 'la', 'maine': 'me', 'maryland': 'md',
+    'massachusetts': 'ma', 'michigan': 'mi', 'minnesota': 'mn', 'mississippi': 'ms',
+    'missouri': 'mo', 'montana': 'mt', 'nebraska': 'ne', 'nevada': 'nv', 'new hampshire': 'nh',
+    'new jersey': 'nj', 'new mexico': 'nm', 'new york': 'ny', 'north carolina': 'nc',
+    'north dakota': 'nd', 'ohio': 'oh', 'oklahoma': 'ok', 'oregon': 'or', 'pennsylvania': 'pa',
+    'rhode island': 'ri', 'south carolina': 'sc', 'south dakota': 'sd', 'tennessee': 'tn',
+    'texas': 'tx', 'utah': 'ut', 'vermont': 'vt', 'virginia': 'va', 'washington': 'wa',
+    'west virginia': 'wv', 'wisconsin': 'wi', 'wyoming': 'wy', 'district of columbia': 'dc'
+}
+STATE_CODES = set(STATE_ABBREVIATIONS.values())
+
+COUNTRY_ALIASES = {
+    'us': 'united states', 'usa': 'united states', 'u.s.': 'united states',
+    'u.s.a.': 'united states', 'united states of america': 'united states',
+    'uk': 'united kingdom', 'u.k.': 'united kingdom', 'great britain': 'united kingdom',
+    'england': 'united kingdom'
+}
+
+# A whole component that is just a zip code, or a zip trailing the state ("ma 02115")
+ZIP_CODE_PATTERN = re.compile(r'^\d{5}(?:-\d{4})?$')
+TRAILING_ZIP_PATTERN = re.compile(r'\s+\d{5}(?:-\d{4})?$')
+
+def normalize_state(state):
+    """Return the two-letter code for a US state name or code, else the cleaned input"""
+    state = ' '.join((state or '').lower().split())
+    return STATE_ABBREVIATIONS.get(state, state)
+
+def _region_component_count(parts):
+    """Count trailing components naming a country or US state rather than a place"""
+    country = COUNTRY_ALIASES.get(parts[-1], parts[-1])
+    if country == 'united states':
+        if len(parts) >= 2 and normalize_state(TRAILING_ZIP_PATTERN.sub('', parts[-2])) in STATE_CODES:
+            return 2
+        return 1
+    return 1
+
+def normalize_address(address):
+    """Build the canonical geocode cache key for a free-form address.
+
+    "Boston, Massachusetts, USA", " boston ,MA 02115" and "02115, Boston, MA"
+    all map to "boston, ma, united states". A zip-only component is dropped in
+    any country when a city or other place remains; otherwise it stays in the
+    key, so "02115, MA" and "01002, MA" do not collide. State names are only
+    mapped when the country is the US, so "Tbilisi, Georgia" keeps its own key.
+    """
+    parts = [' '.join(part.split()) for part in (address or '').lower().split(',')]
+    parts = [part for part in parts if part]
+    if not parts:
+        return ''
+    # Zip-only components are redundant postal fields when a place names the
+    # location, but they are the location when only a state or country remains
+    places = [part for part in parts if not ZIP_CODE_PATTERN.match(part)]
+    if places and len(places) > _region_component_count(places):
+        parts = places
+
+    parts[-1] = COUNTRY_ALIASES.get(parts[-1], parts[-1])
+    if parts[-1] != 'united states':
+        # Without a country, only a trailing state code marks a US address
+        state = TRAILING_ZIP_PATTERN.sub('', parts[-1])
+        if len(parts) < 2 or state not in STATE_CODES:
+            return ', '.join(parts)
+        parts[-1] = state
+        parts.append('united states')
+
+    state_index = len(parts) - 2
+    if state_index >= 1:
+        parts[state_index] = normalize_state(TRAILING_ZIP_PATTERN.sub('', parts[state_index]))
+    return ', '.join(parts)
+
+def get_geocode_cache_stats():
+    """Return geocode cache hit/miss counts and ratios"""
+    hits = geocode_cache_stats['hits']
+    misses = geocode_cache_stats['misses']
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / lookups, 4) if lookups else None,
+        'miss_ratio': round(misses / lookups, 4) if lookups else None,
+        'entries': len(_geocoding_cache) if _geocoding_cache is not None else 0
+    }
+
+def migrate_geocoding_cache_keys(cache):
+    """Re-key a loaded cache to canonical addresses, keeping the newest duplicate.
+
+    Returns the number of keys changed; zero once the cache has been migrated.
+    """
+    stale_keys = [key for key in cache if normalize_address(key) != key]
+    for key in stale_keys:
+        value = cache.pop(key)
+        canonical_key = normalize_address(key)
+        if not canonical_key:
+            continue
+        existing = cache.get(canonical_key)
+        if isinstance(existing, dict) and isinstance(value, dict) and \
+                existing.get('timestamp', '') >= value.get('timestamp', ''):
+            continue
+        cache[canonical_key] = value
+    return len(stale_keys)
+
+def load_environment():
+    """Load environment variables once per process"""
+    global GOOGLE_MAPS_API_KEY, _environment_loaded
+    if _environment_loaded:
+        return
+    start = time.perf_counter()
+    load_dotenv()
+    GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY', '')
+    if not GOOGLE_MAPS_API_KEY:
+        logger.warning("No Google Maps API key found in environment variables")
+    _environment_loaded = True
+    startup_metrics['env_load_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+def get_geocoding_cache():
+    """Return the geocoding cache, loading it from disk on first use"""
+    global _geocoding_cache
+    if _geocoding_cache is not None:
+        return _geocoding_cache
+    with _geocoding_cache_lock:
+        if _geocoding_cache is not None:
+            return _geocoding_cache
+        start = time.perf_counter()
+        cache = {}
+        try:
+            if os.path.exists(CACHE_FILE) and os.path.getsize(CACHE_FILE) > 0:
+                with open(CACHE_FILE, 'rb') as f:
+                    cache = pickle.load(f)
+                    logger.debug(f"Loaded {len(cache)} cached locations")
+        except Exception as e:
+            logger.warning(f"Failed to load geocoding cache: {e}")
+        startup_metrics['cache_load_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+        # Migrate and clean before publishing, so lock-free readers never see
+        # (or insert into) the dict while it is being rewritten
+
+        # One-time migration of keys written before address normalization
+        migrated = migrate_geocoding_cache_keys(cache)
+        if migrated:
+            logger.info(f"Migrated {migrated} geocoding cache keys to canonical form")
+            mark_geocoding_cache_dirty()
+            save_geocoding_cache(cache)
+
+        # Clean cache if needed
+        if len(cache) > 100:
+            start = time.perf_counter()
+            clean_geocoding_cache(cache)
+            startup_metrics['cache_clean_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+        startup_metrics['cache_entries'] = len(cache)
+        startup_metrics['cache_loaded_pid'] = os.getpid()
+        _geocoding_cache = cache
+    return _geocoding_cache
+
+def init_trials(preload=False):
+    """Initialize the trials API explicitly at app startup.
+
+    With preload=True the geocoding cache is built immediately, so a gunicorn
+    master running with preload_app shares it copy-on-write with its workers.
+    Otherwise the cache is loaded lazily on the first lookup.
+    """
+    load_environment()
+    if preload:
+        get_geocoding_cache()
+        startup_metrics['eager_cache'] = True
+    return startup_metrics
+
+def mark_geocoding_cache_dirty():
+    """Record that the cache has changes not yet written to disk"""
+    global _geocoding_cache_dirty
+    _geocoding_cache_dirty = True
+
+def has_unsaved_geocodes():
+    """Return whether the cache has changed since it was last saved"""
+    return _geocoding_cache_dirty
+
+def save_geocoding_cache(cache=None):
+    """Save geocoding cache to disk if it has changed"""
+    global _geocoding_cache_dirty
+    if cache is None:
+        cache = get_geocoding_cache()
+    with _geocoding_cache_save_lock:
+        if not _geocoding_cache_dirty:
+            return
+        _geocoding_cache_dirty = False
+        temp_file = f"{CACHE_FILE}.{os.getpid()}.tmp"
+        try:
+            # Snapshot first so concurrent lookups cannot resize the dict mid-dump,
+            # and replace the file atomically so readers never see a partial pickle
+            with open(temp_file, 'wb') as f:
+                pickle.dump(dict(cache), f)
+            os.replace(temp_file, CACHE_FILE)
+        except Exception as e:
+            _geocoding_cache_dirty = True
+            logger.warning(f"Failed to save geocoding cache: {e}")
 
 class TrialAPI:
     BASE_URL = "https://clinicaltrials.gov/api/v2/studies"
+    GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
     
     @staticmethod
     def search_trials(condition, location=None, max_results=1000, distance_miles=1000):
@@ -53,12 +256,7 @@ class TrialAPI:
         try:
             logger.debug(f"Searching for trials with condition: {condition}, location: {location}")
             
-            # Build query parameters for v2 API
-            params = {
-                "query.term": f"{condition}" + (f" AND AREA[LocationCity]{location.split(',')[0].strip()}" if location else ""),
-                "pageSize": max_results,
-                "format": "json"
-            }
+            params = TrialAPI.build_search_params(condition, location, max_results)
             
             logger.debug(f"API request URL: {TrialAPI.BASE_URL}")
             logger.debug(f"API request params: {params}")
@@ -71,11 +269,8 @@ class TrialAPI:
                 logger.error(f"API error: {response.text}")
                 return {"error": "Failed to fetch clinical trials", "details": response.text}
             
-            # Process and format the response
-            data = response.json()
-            
             # Extract studies from the response structure
-            studies = data.get('studies', [])
+            studies = response.json().get('studies', [])
             logger.debug(f"Found {len(studies)} studies")
             
             if not studies:
@@ -83,79 +278,224 @@ class TrialAPI:
                 return []
             
             # Get user location geocoding if provided
-            user_geo = None
-            user_latitude = None
-            user_longitude = None
-            user_state = None
+            user_geo = TrialAPI.geocode_location(location) if location else None
             
-            if location:
-                user_geo = TrialAPI.geocode_location(location)
-                if user_geo:
-                    user_latitude = user_geo['lat']
-                    user_longitude = user_geo['lng']
-                
-                # Extract user state for filtering
-                if ',' in location:
-                    parts = location.split(',')
-                    if len(parts) >= 2:
-                        user_state = parts[1].strip().lower()
+            formatted_trials = TrialAPI.format_trials(
+                studies, location, user_geo, distance_miles, TrialAPI.geocode_location
+            )
+            save_geocoding_cache()
+            return formatted_trials
             
-            formatted_trials = []
-            for study in studies:
-                try:
-                    protocol = study.get('protocolSection', {})
-                    identification = protocol.get('identificationModule', {})
-                    description = protocol.get('descriptionModule', {})
-                    conditions_module = protocol.get('conditionsModule', {})
-                    eligibility = protocol.get('eligibilityModule', {})
-                    contacts = protocol.get('contactsLocationsModule', {})
-                    interventions_module = protocol.get('armsInterventionsModule', {})
-                    detailed_description = description.get('detailedDescription', '')
-                    
-                    # Get NCT ID first as identifier for logging
-                    nct_id = identification.get('nctId', 'unknown')
-                    
-                    # Safely get conditions list
-                    conditions = conditions_module.get('conditions', [])
-                    if not isinstance(conditions, list):
-                        conditions = [str(conditions)]
-                    
-                    # Extract eligibility criteria for allergy checking
-                    criteria_text = eligibility.get('eligibilityCriteria', '')
-                    
-                    # Check for compensation info in the detailed description
-                    compensation_info = TrialAPI.extract_compensation_info(detailed_description)
-                    
-                    # Format gender for display
-                    gender = eligibility.get('sex', '')
-                    if not gender:
-                        gender = 'All'
-                    
-                    # Format the trial data into a cleaner structure
-                    trial = {
-                        'id': nct_id,
-                        'title': identification.get('briefTitle', ''),
-                        'conditions': conditions,
-                        'summary': description.get('briefSummary', ''),
-                        'gender': gender,
-                        'age_range': {
-                            'min': eligibility.get('minimumAge', ''),
-                            'max': eligibility.get('maximumAge', '')
-                        },
-                        'locations': [],
-                        'compensation': compensation_info,
-                        'eligibilityCriteria': criteria_text,
-                        'substancesUsed': TrialAPI.extract_substances(interventions_module)
-                    }
-                    
-                    # Process location data
-                    locations = contacts.get('locations', [])
-                    min_distance = float('inf')
+        except Exception as e:
+            logger.exception(f"Error searching trials: {str(e)}")
+            return {"error": f"Failed to search trials: {str(e)}"}
+    
+    @staticmethod
+    def build_search_params(condition, location=None, max_results=1000):
+        """Build query parameters for the ClinicalTrials.gov v2 API"""
+        return {
+            "query.term": f"{condition}" + (f" AND AREA[LocationCity]{location.split(',')[0].strip()}" if location else ""),
+            "pageSize": max_results,
+            "format": "json"
+        }
+    
+    @staticmethod
+    def parse_user_state(location):
+        """Extract the user's state from a "city, state" location for filtering"""
+        if location and ',' in location:
+            parts = location.split(',')
+            if len(parts) >= 2:
+                return normalize_state(parts[1])
+        return None
+    
+    @staticmethod
+    def select_locations(locations, user_state):
+        """Pick at most 3 trial sites, preferring the user's state and region"""
+        same_state_locations = []
+        other_locations = []
+        
+        for loc in locations:
+            state = normalize_state(loc.get('state', ''))
+            # Skip locations in different regions to reduce geocoding
+            if user_state and state and TrialAPI.is_different_region(user_state, state):
+                continue
+                
+            if user_state and state and state == user_state:
+                same_state_locations.append(loc)
+            else:
+                other_locations.append(loc)
+        
+        # Process at most 3 locations per trial - prioritize same state
+        return (same_state_locations + other_locations)[:3]
+    
+    @staticmethod
+    def location_address(location_data):
+        """Build the address geocoded for a trial site, or None without a city"""
+        city = location_data.get('city', '')
+        if not city:
+            return None
+        location_address = f"{city}, {location_data.get('state', '')}, {location_data.get('country', '')}".strip()
+        if not location_address or location_address == ", ":
+            return None
+        return location_address
+    
+    @staticmethod
+    def site_addresses(studies, location):
+        """List the trial site addresses format_trials will geocode for these studies"""
+        user_state = TrialAPI.parse_user_state(location)
+        addresses = []
+        for study in studies:
+            contacts = study.get('protocolSection', {}).get('contactsLocationsModule', {})
+            for location_data in TrialAPI.select_locations(contacts.get('locations', []), user_state):
+                address = TrialAPI.location_address(location_data)
+                if address:
+                    addresses.append(address)
+        return addresses
+    
+    @staticmethod
+    def format_trials(studies, location, user_geo, distance_miles, geocode):
+        """Format raw studies into trials sorted by distance from the user.
+
+        geocode is called with each site address and returns a geocode dict or
+        None, letting sync and async callers resolve addresses their own way.
+        """
+        user_latitude = None
+        user_longitude = None
+        if user_geo:
+            user_latitude = user_geo['lat']
+            user_longitude = user_geo['lng']
+        user_state = TrialAPI.parse_user_state(location)
+        
+        formatted_trials = []
+        for study in studies:
+            try:
+                protocol = study.get('protocolSection', {})
+                identification = protocol.get('identificationModule', {})
+                description = protocol.get('descriptionModule', {})
+                conditions_module = protocol.get('conditionsModule', {})
+                eligibility = protocol.get('eligibilityModule', {})
+                contacts = protocol.get('contactsLocationsModule', {})
+                interventions_module = protocol.get('armsInterventionsModule', {})
+                detailed_description = description.get('detailedDescription', '')
+                
+                # Get NCT ID first as identifier for logging
+                nct_id = identification.get('nctId', 'unknown')
+                
+                # Safely get conditions list
+                conditions = conditions_module.get('conditions', [])
+                if not isinstance(conditions, list):
+                    conditions = [str(conditions)]
+                
+                # Extract eligibility criteria for allergy checking
+                criteria_text = eligibility.get('eligibilityCriteria', '')
+                
+                # Check for compensation info in the detailed description
+                compensation_info = TrialAPI.extract_compensation_info(detailed_description)
+                
+                # Format gender for display
+                gender = eligibility.get('sex', '')
+                if not gender:
+                    gender = 'All'
+                
+                # Format the trial data into a cleaner structure
+                trial = {
+                    'id': nct_id,
+                    'title': identification.get('briefTitle', ''),
+                    'conditions': conditions,
+                    'summary': description.get('briefSummary', ''),
+                    'gender': gender,
+                    'age_range': {
+                        'min': eligibility.get('minimumAge', ''),
+                        'max': eligibility.get('maximumAge', '')
+                    },
+                    'locations': [],
+                    'compensation': compensation_info,
+                    'eligibilityCriteria': criteria_text,
+                    'substancesUsed': TrialAPI.extract_substances(interventions_module)
+                }
+                
+                # Process location data
+                locations = contacts.get('locations', [])
+                min_distance = float('inf')
+                
+                if not locations:
+                    # Add a default location if none provided
+                    trial['locations'] = [{
+                        'facility': 'Location not specified',
+                        'city': '',
+                        'state': '',
+                        'country': '',
+                        'zip': '',
+                        'latitude': None,
+                        'longitude': None,
+                        'distance': None
+                    }]
+                else:
+                    for location_data in TrialAPI.select_locations(locations, user_state):
+                        try:
+                            # Handle facility which could be a string or an object
+                            facility_name = ''
+                            facility_data = location_data.get('facility', {})
+                            if isinstance(facility_data, dict):
+                                facility_name = facility_data.get('name', '')
+                            else:
+                                facility_name = str(facility_data)
+                            
+                            # Get location details
+                            city = location_data.get('city', '')
+                            state = location_data.get('state', '')
+                            country = location_data.get('country', '')
+                            zip_code = location_data.get('zip', '')
+                            
+                            # Skip geocoding if user location is unknown
+                            latitude = None
+                            longitude = None
+                            distance = None
+
+                            # Only calculate distance if user location is available
+                            location_address = TrialAPI.location_address(location_data)
+                            if user_latitude and user_longitude and location_address:
+                                location_geo = geocode(location_address)
+                                
+                                if location_geo and 'lat' in location_geo and 'lng' in location_geo:
+                                    latitude = location_geo['lat']
+                                    longitude = location_geo['lng']
+                                    # Calculate distance with stronger validation
+                                    if latitude and longitude and user_latitude and user_longitude:
+                                        try:
+                                            distance = TrialAPI.calculate_distance(
+                                                user_latitude, user_longitude, latitude, longitude
+                                            )
+                                            
+                                            # Log the exact distance calculated for debugging
+                                            logger.debug(f"Calculated distance for {location_address}: {distance} miles")
+                                            
+                                            # Only update minimum distance if we got a valid number
+                                            if isinstance(distance, (int, float)):
+                                                min_distance = min(min_distance, distance)
+                                        except Exception as e:
+                                            logger.error(f"Distance calculation error for {city}: {str(e)}")
+                            
+                            location_info = {
+                                'facility': facility_name,
+                                'city': city,
+                                'state': state,
+                                'country': country,
+                                'zip': zip_code,
+                                'latitude': latitude,
+                                'longitude': longitude,
+                                'distance': distance
+                            }
+                            
+                            trial['locations'].append(location_info)
+                        except Exception as e:
+                            logger.exception(f"Error processing location for trial {nct_id}: {str(e)}")
                     
-                    if not locations:
-                        # Add a default location if none provided
-                        trial['locations'] = [{
-                            'facility': 'Location not specified',
+                    # If we limited the locations, add a summary
+                    remaining_locations = len(locations) - len(trial['locations'])
+                    if remaining_locations > 0:
+                        trial['locations'].append({
+                            'facility': f"+ {remaining_locations} more locations",
                             'city': '',
                             'state': '',
                             'country': '',
@@ -163,179 +503,67 @@ class TrialAPI:
                             'latitude': None,
                             'longitude': None,
                             'distance': None
-                        }]
+                        })
+                
+                    # Add the minimum distance to the nearest location
+                    if min_distance != float('inf'):
+                        trial['distance'] = min_distance
                     else:
-                        # Prioritize locations in the same state as the user
-                        same_state_locations = []
-                        other_locations = []
-                        
-                        for loc in locations:
-                            state = loc.get('state', '').lower()
-                            # Skip locations in different regions to reduce geocoding
-                            if user_state and state and TrialAPI.is_different_region(user_state, state):
-                                continue
-                                
-                            if user_state and state and state == user_state:
-                                same_state_locations.append(loc)
-                            else:
-                                other_locations.append(loc)
-                        
-                        # Process at most 3 locations per trial - prioritize same state
-                        locations_to_process = (same_state_locations + other_locations)[:3]
-                        
-                        for location_data in locations_to_process:
-                            try:
-                                # Handle facility which could be a string or an object
-                                facility_name = ''
-                                facility_data = location_data.get('facility', {})
-                                if isinstance(facility_data, dict):
-                                    facility_name = facility_data.get('name', '')
-                                else:
-                                    facility_name = str(facility_data)
-                                
-                                # Get location details
-                                city = location_data.get('city', '')
-                                state = location_data.get('state', '')
-                                country = location_data.get('country', '')
-                                zip_code = location_data.get('zip', '')
-                                
-                                # Skip geocoding if user location is unknown
-                                latitude = None
-                                longitude = None
-                                distance = None
-
-                                # Only calculate distance if user location is available
-                                if user_latitude and user_longitude and city:
-                                    # Create a cache key for this location to avoid duplicate geocoding
-                                    location_address = f"{city}, {state}, {country}".strip()
-                                    if location_address and location_address != ", ":
-                                        # Use cached geocode if available
-                                        cache_key = location_address.lower()
-                                        if cache_key in geocoding_cache:
-                                            location_geo = geocoding_cache[cache_key]
-                                        else:
-                                            # Only geocode if we have meaningful address information
-                                            location_geo = TrialAPI.geocode_location(location_address)
-                                            if location_geo:
-                                                geocoding_cache[cache_key] = location_geo
-                                        
-                                        if location_geo and 'lat' in location_geo and 'lng' in location_geo:
-                                            latitude = location_geo['lat']
-                                            longitude = location_geo['lng']
-                                            # Calculate distance with stronger validation
-                                            if latitude and longitude and user_latitude and user_longitude:
-                                                try:
-                                                    distance = TrialAPI.calculate_distance(
-                                                        user_latitude, user_longitude, latitude, longitude
-                                                    )
-                                                    
-                                                    # Log the exact distance calculated for debugging
-                                                    logger.debug(f"Calculated distance for {location_address}: {distance} miles")
-                                                    
-                                                    # Only update minimum distance if we got a valid number
-                                                    if isinstance(distance, (int, float)):
-                                                        min_distance = min(min_distance, distance)
-                                                except Exception as e:
-                                                    logger.error(f"Distance calculation error for {city}: {str(e)}")
-                                
-                                location_info = {
-                                    'facility': facility_name,
-                                    'city': city,
-                                    'state': state,
-                                    'country': country,
-                                    'zip': zip_code,
-                                    'latitude': latitude,
-                                    'longitude': longitude,
-                                    'distance': distance
-                                }
-                                
-                                trial['locations'].append(location_info)
-                            except Exception as e:
-                                logger.exception(f"Error processing location for trial {nct_id}: {str(e)}")
-                        
-                        # If we limited the locations, add a summary
-                        remaining_locations = len(locations) - len(trial['locations'])
-                        if remaining_locations > 0:
-                            trial['locations'].append({
-                                'facility': f"+ {remaining_locations} more locations",
-                                'city': '',
-                                'state': '',
-                                'country': '',
-                                'zip': '',
-                                'latitude': None,
-                                'longitude': None,
-                                'distance': None
-                            })
-                    
-                        # Add the minimum distance to the nearest location
-                        if min_distance != float('inf'):
-                            trial['distance'] = min_distance
-                        else:
-                            trial['distance'] = None  # Explicitly set to None for better sorting
-
-                        # Only include trials that meet distance criteria
-                        if user_latitude is None:
-                            # If no user location, include all trials
-                            formatted_trials.append(trial)
-                        elif min_distance == float('inf'):
-                            # If distance couldn't be calculated but we have user location, include but low priority
-                            trial['distance'] = 9999  # Very far away but sortable
-                            formatted_trials.append(trial)
-                        elif min_distance <= distance_miles:
-                            # Include trials within specified distance
-                            formatted_trials.append(trial)
-
-                except Exception as e:
-                    logger.exception(f"Error processing trial: {str(e)}")
-                    continue
-            
-            # Save geocoding cache
-            if len(geocoding_cache) % 10 == 0:
-                save_geocoding_cache()
-            
-            if user_latitude and user_longitude:
+                        trial['distance'] = None  # Explicitly set to None for better sorting
+
+                    # Only include trials that meet distance criteria
+                    if user_latitude is None:
+                        # If no user location, include all trials
+                        formatted_trials.append(trial)
+                    elif min_distance == float('inf'):
+                        # If distance couldn't be calculated but we have user location, include but low priority
+                        trial['distance'] = 9999  # Very far away but sortable
+                        formatted_trials.append(trial)
+                    elif min_distance <= distance_miles:
+                        # Include trials within specified distance
+                        formatted_trials.append(trial)
+
+            except Exception as e:
+                logger.exception(f"Error processing trial: {str(e)}")
+                continue
+        
+        if user_latitude and user_longitude:
             # Ensure all trials have proper distance values for sorting
-                for trial in formatted_trials:
-                    if trial.get('distance') is None:
-                        # Use a very large number for undefined distances to place at the end
-                        trial['distance'] = float('inf')
-                
-                # Log before sorting
-                logger.debug("Pre-sort trial distances:")
-                for idx, trial in enumerate(formatted_trials[:5]):
-                    logger.debug(f"  #{idx+1}: ID={trial['id']}, distance={trial.get('distance')}")
-                
-                # Sort using stable numeric comparison
-                formatted_trials.sort(key=lambda t: (
-                    # Primary sort: distance value (handles float('inf') values)
-                    float(t.get('distance', float('inf'))),
-                    # Secondary sort: by ID to ensure consistent order for same distances
-                    t.get('id', '')
-                ))
+            for trial in formatted_trials:
+                if trial.get('distance') is None:
+                    # Use a very large number for undefined distances to place at the end
+                    trial['distance'] = float('inf')
+            
+            # Log before sorting
+            logger.debug("Pre-sort trial distances:")
+            for idx, trial in enumerate(formatted_trials[:5]):
+                logger.debug(f"  #{idx+1}: ID={trial['id']}, distance={trial.get('distance')}")
+            
+            # Sort using stable numeric comparison
+            formatted_trials.sort(key=lambda t: (
+                # Primary sort: distance value (handles float('inf') values)
+                float(t.get('distance', float('inf'))),
+                # Secondary sort: by ID to ensure consistent order for same distances
+                t.get('id', '')
+            ))
+            
+            # Log after sorting
+            logger.debug("Post-sort trial distances:")
+            for idx, trial in enumerate(formatted_trials[:5]):
+                logger.debug(f"  #{idx+1}: ID={trial['id']}, distance={trial.get('distance')}")
                 
-                # Log after sorting
-                logger.debug("Post-sort trial distances:")
-                for idx, trial in enumerate(formatted_trials[:5]):
-                    logger.debug(f"  #{idx+1}: ID={trial['id']}, distance={trial.get('distance')}")
-                    
-                # Remove infinite distance marker for frontend display
-                for trial in formatted_trials:
-                    if trial.get('distance') == float('inf'):
-                        trial['distance'] = None
-                        
-            save_geocoding_cache()
-
+            # Remove infinite distance marker for frontend display
             for trial in formatted_trials:
-                trial_locations = trial.get('locations', [])
-                location_distances = [loc.get('distance') for loc in trial_locations]
-                logger.info(f"Trial {trial['id']} - distance: {trial.get('distance')}, location distances: {location_distances}")
+                if trial.get('distance') == float('inf'):
+                    trial['distance'] = None
 
-            logger.debug(f"Returning {len(formatted_trials)} formatted trials")
-            return formatted_trials
-            
-        except Exception as e:
-            logger.exception(f"Error searching trials: {str(e)}")
-            return {"error": f"Failed to search trials: {str(e)}"}
+        for trial in formatted_trials:
+            trial_locations = trial.get('locations', [])
+            location_distances = [loc.get('distance') for loc in trial_locations]
+            logger.info(f"Trial {trial['id']} - distance: {trial.get('distance')}, location distances: {location_distances}")
+
+        logger.debug(f"Returning {len(formatted_trials)} formatted trials")
+        return formatted_trials
     
     @staticmethod
     def is_different_region(state1, state2):
@@ -347,27 +575,9 @@ class TrialAPI:
             'northeast': ['me', 'nh', 'vt', 'ma', 'ri', 'ct', 'ny', 'pa', 'nj', 'de', 'md', 'dc']
         }
         
-        state_map = {
-            'alabama': 'al', 'alaska': 'ak', 'arizona': 'az', 'arkansas': 'ar', 'california': 'ca',
-            'colorado': 'co', 'connecticut': 'ct', 'delaware': 'de', 'florida': 'fl', 'georgia': 'ga',
-            'hawaii': 'hi', 'idaho': 'id', 'illinois': 'il', 'indiana': 'in', 'iowa': 'ia',
-            'kansas': 'ks', 'kentucky': 'ky', 'louisiana': 'la', 'maine': 'me', 'maryland': 'md',
-            'massachusetts': 'ma', 'michigan': 'mi', 'minnesota': 'mn', 'mississippi': 'ms',
-            'missouri': 'mo', 'montana': 'mt', 'nebraska': 'ne', 'nevada': 'nv', 'new hampshire': 'nh',
-            'new jersey': 'nj', 'new mexico': 'nm', 'new york': 'ny', 'north carolina': 'nc',
-            'north dakota': 'nd', 'ohio': 'oh', 'oklahoma': 'ok', 'oregon': 'or', 'pennsylvania': 'pa',
-            'rhode island': 'ri', 'south carolina': 'sc', 'south dakota': 'sd', 'tennessee': 'tn',
-            'texas': 'tx', 'utah': 'ut', 'vermont': 'vt', 'virginia': 'va', 'washington': 'wa',
-            'west virginia': 'wv', 'wisconsin': 'wi', 'wyoming': 'wy'
-        }
-        
-        # Convert to state codes (case insensitive)
-        state1 = state1.lower().strip()
-        state2 = state2.lower().strip()
-        
-        # Convert to codes if full state names
-        state1_code = state1 if len(state1) <= 2 else state_map.get(state1, '')
-        state2_code = state2 if len(state2) <= 2 else state_map.get(state2, '')
+        # Convert to state codes (case insensitive, full names or codes)
+        state1_code = normalize_state(state1)
+        state2_code = normalize_state(state2)
         
         # Find regions
         state1_region = None
@@ -392,15 +602,15 @@ class TrialAPI:
                 return None
             
             # Check cache first
-            cache_key = address.lower()
-            if cache_key in geocoding_cache:
-                logger.debug(f"Using cached geocode for {address}")
-                return geocoding_cache[cache_key]
+            cache_key, cached = TrialAPI.lookup_cached_geocode(address)
+            if cached is not None:
+                return cached
                 
             # Add rate limiting - ensure we don't make requests too quickly
             time.sleep(0.1)
                 
             # Check if API key is available
+            load_environment()
             if not GOOGLE_MAPS_API_KEY:
                 logger.warning("No Google Maps API key provided, cannot geocode")
                 return None
@@ -413,41 +623,59 @@ class TrialAPI:
                 'key': GOOGLE_MAPS_API_KEY
             }
             
-            response = requests.get('https://maps.googleapis.com/maps/api/geocode/json', params=params)
+            response = requests.get(TrialAPI.GEOCODE_URL, params=params)
             
             if response.status_code != 200:
                 logger.error(f"Geocoding API error: {response.status_code} - {response.text}")
                 return None
             
-            data = response.json()
-            logger.debug(f"Geocoding response status: {data.get('status')}")
-            
-            if data.get('status') != 'OK' or not data.get('results'):
-                logger.error(f"Geocoding failed: {data.get('status')}")
-                return None
-            
-            # Extract location data
-            result = data['results'][0]
-            location = result['geometry']['location']
-            
-            geocode_result = {
-                'lat': location['lat'],
-                'lng': location['lng'],
-                'formatted_address': result['formatted_address'],
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            # Debug the geocode result
-            logger.debug(f"Geocoded {address} to {geocode_result['lat']}, {geocode_result['lng']}")
-            
-            # Cache the result
-            geocoding_cache[cache_key] = geocode_result
-            
-            return geocode_result
+            return TrialAPI.store_geocode_response(address, cache_key, response.json())
         
         except Exception as e:
             logger.exception(f"Error in geocoding: {str(e)}")
             return None
+    
+    @staticmethod
+    def lookup_cached_geocode(address):
+        """Return the canonical cache key and cached geocode (or None) for an address"""
+        geocoding_cache = get_geocoding_cache()
+        cache_key = normalize_address(address)
+        if cache_key in geocoding_cache:
+            geocode_cache_stats['hits'] += 1
+            logger.debug(f"Using cached geocode for {address}")
+            return cache_key, geocoding_cache[cache_key]
+        geocode_cache_stats['misses'] += 1
+        return cache_key, None
+    
+    @staticmethod
+    def store_geocode_response(address, cache_key, data):
+        """Extract and cache the geocode from a Geocoding API response body"""
+        logger.debug(f"Geocoding response status: {data.get('status')}")
+        
+        if data.get('status') != 'OK' or not data.get('results'):
+            logger.error(f"Geocoding failed: {data.get('status')}")
+            return None
+        
+        # Extract location data
+        result = data['results'][0]
+        location = result['geometry']['location']
+        
+        geocode_result = {
+            'lat': location['lat'],
+            'lng': location['lng'],
+            'formatted_address': result['formatted_address'],
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        # Debug the geocode result
+        logger.debug(f"Geocoded {address} to {geocode_result['lat']}, {geocode_result['lng']}")
+        
+        # Cache the result
+        get_geocoding_cache()[cache_key] = geocode_result
+        mark_geocoding_cache_dirty()
+        
+        return geocode_result
+
     @staticmethod
     def mock_geocode_location(address):
         """Provide mock geocoding for development/testing purposes"""
@@ -605,10 +833,12 @@ class TrialAPI:
         
         return substances
 
-# Clean old geocoding cache entries on module load
-def clean_geocoding_cache():
+# Clean old geocoding cache entries when the cache is first loaded
+def clean_geocoding_cache(geocoding_cache=None):
     """Remove cache entries older than 30 days"""
     try:
+        if geocoding_cache is None:
+            geocoding_cache = get_geocoding_cache()
         cutoff_time = datetime.now() - timedelta(days=30)
         old_entries = []
         
@@ -626,10 +856,7 @@ def clean_geocoding_cache():
             
         if old_entries:
             logger.debug(f"Cleaned {len(old_entries)} old entries from geocoding cache")
-            save_geocoding_cache()
+            mark_geocoding_cache_dirty()
+            save_geocoding_cache(geocoding_cache)
     except Exception as e:
         logger.warning(f"Failed to clean geocoding cache: {e}")
-
-# Clean cache if needed
-if len(geocoding_cache) > 100:
-    clean_geocoding_cache()
\ No newline at end of file
@@ -0,0 +1,177 @@
+# backend/api/trials_async.py
+import asyncio
+import contextvars
+import functools
+import logging
+import httpx
+from api import trials
+from api.trials import TrialAPI, normalize_address, has_unsaved_geocodes, save_geocoding_cache
+
+logger = logging.getLogger(__name__)
+
+# Geocoding API limits per process, shared by all searches: requests start no
+# faster than the sync path's 0.1s spacing, with at most this many in flight
+GEOCODE_RATE_PER_SECOND = 10
+GEOCODE_CONCURRENCY = 10
+UPSTREAM_TIMEOUT = 30.0
+
+_client = None
+_geocode_limiter = None
+# canonical address -> in-flight geocode task, so concurrent searches share one request
+_pending_geocodes = {}
+
+class RateLimiter:
+    """Async context manager capping concurrency and start rate of upstream calls"""
+
+    def __init__(self, rate_per_second, concurrency):
+        self.interval = 1.0 / rate_per_second
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.next_start = 0.0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        # Reserve the next start slot before sleeping so waiters queue in order
+        now = asyncio.get_running_loop().time()
+        start = max(now, self.next_start)
+        self.next_start = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.semaphore.release()
+
+def get_client():
+    """Return the process-wide async HTTP client, created inside the running loop"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=UPSTREAM_TIMEOUT,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        )
+    return _client
+
+def get_geocode_limiter():
+    """Return the process-wide Geocoding API limiter, created inside the running loop"""
+    global _geocode_limiter
+    if _geocode_limiter is None:
+        _geocode_limiter = RateLimiter(GEOCODE_RATE_PER_SECOND, GEOCODE_CONCURRENCY)
+    return _geocode_limiter
+
+async def close_client():
+    """Close the shared HTTP client on shutdown"""
+    global _client, _geocode_limiter
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _geocode_limiter = None
+
+async def run_in_thread(func, *args):
+    """Run CPU-bound work off the event loop, keeping context such as Flask's request"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(context.run, func, *args)
+    )
+
+async def geocode_location_async(address):
+    """Non-blocking counterpart of TrialAPI.geocode_location sharing its cache"""
+    try:
+        # Skip empty addresses
+        if not address or address.strip() == "" or address.strip() == ", ":
+            logger.debug("Skipping geocoding for empty address")
+            return None
+
+        cache_key, cached = TrialAPI.lookup_cached_geocode(address)
+        if cached is not None:
+            return cached
+
+        pending = _pending_geocodes.get(cache_key)
+        if pending is None:
+            pending = asyncio.ensure_future(_fetch_geocode(address, cache_key))
+            _pending_geocodes[cache_key] = pending
+            pending.add_done_callback(lambda _: _pending_geocodes.pop(cache_key, None))
+        # Shield so one cancelled search does not cancel the lookup for the others
+        return await asyncio.shield(pending)
+
+    except Exception as e:
+        logger.exception(f"Error in geocoding: {str(e)}")
+        return None
+
+async def _fetch_geocode(address, cache_key):
+    """Call the Geocoding API for an uncached address and cache the result"""
+    try:
+        trials.load_environment()
+        if not trials.GOOGLE_MAPS_API_KEY:
+            logger.warning("No Google Maps API key provided, cannot geocode")
+            return None
+
+        logger.debug(f"Geocoding address: {address}")
+        params = {
+            'address': address,
+            'key': trials.GOOGLE_MAPS_API_KEY
+        }
+
+        async with get_geocode_limiter():
+            response = await get_client().get(TrialAPI.GEOCODE_URL, params=params)
+
+        if response.status_code != 200:
+            logger.error(f"Geocoding API error: {response.status_code} - {response.text}")
+            return None
+
+        return TrialAPI.store_geocode_response(address, cache_key, response.json())
+
+    except Exception as e:
+        logger.exception(f"Error in geocoding: {str(e)}")
+        return None
+
+async def search_trials_async(condition, location=None, max_results=1000, distance_miles=1000):
+    """Search for clinical trials without blocking the event loop on upstream I/O.
+
+    Returns the same structure as TrialAPI.search_trials.
+    """
+    try:
+        logger.debug(f"Searching for trials with condition: {condition}, location: {location}")
+
+        params = TrialAPI.build_search_params(condition, location, max_results)
+
+        # Fetch studies and the user's location concurrently
+        study_request = get_client().get(TrialAPI.BASE_URL, params=params)
+        if location:
+            response, user_geo = await asyncio.gather(study_request, geocode_location_async(location))
+        else:
+            response, user_geo = await study_request, None
+
+        logger.debug(f"API response status: {response.status_code}")
+        if response.status_code != 200:
+            logger.error(f"API error: {response.text}")
+            return {"error": "Failed to fetch clinical trials", "details": response.text}
+
+        studies = (await run_in_thread(response.json)).get('studies', [])
+        logger.debug(f"Found {len(studies)} studies")
+
+        if not studies:
+            logger.warning("No studies found")
+            return []
+
+        # Resolve every site format_trials will need up front, one request per canonical address
+        geocodes = {}
+        if user_geo:
+            addresses = {}
+            for address in TrialAPI.site_addresses(studies, location):
+                addresses.setdefault(normalize_address(address), address)
+            results = await asyncio.gather(
+                *(geocode_location_async(address) for address in addresses.values())
+            )
+            geocodes = dict(zip(addresses, results))
+
+        # Formatting large result sets is CPU-bound; keep it off the event loop
+        formatted_trials = await run_in_thread(
+            TrialAPI.format_trials, studies, location, user_geo, distance_miles,
+            lambda address: geocodes.get(normalize_address(address))
+        )
+        if has_unsaved_geocodes():
+            await run_in_thread(save_geocoding_cache)
+        return formatted_trials
+
+    except Exception as e:
+        logger.exception(f"Error searching trials: {str(e)}")
+        return {"error": f"Failed to search trials: {str(e)}"}
@@ -1,8 +1,10 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from api.trials import TrialAPI
+from api.trials import TrialAPI, init_trials, load_environment, startup_metrics, get_geocode_cache_stats
+from api.responses import cached_json_response
 import logging
 import os
+import time
 
 app = Flask(__name__)
 CORS(app, origins=["https://clinicrush.vercel.app"])
@@ -10,6 +12,15 @@ CORS(app, origins=["https://clinicrush.vercel.app"])
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Explicit startup: load env and, when preloading, build the geocoding cache
+# once so gunicorn workers forked from this process share it copy-on-write.
+# .env is loaded first so PRELOAD_APP can be set there too.
+_init_start = time.perf_counter()
+load_environment()
+PRELOAD_APP = os.environ.get('PRELOAD_APP', 'true').lower() == 'true'
+init_trials(preload=PRELOAD_APP)
+startup_metrics['app_init_ms'] = round((time.perf_counter() - _init_start) * 1000, 2)
+
 # backend/app.py in the search_trials route
 @app.route('/api/trials/search', methods=['GET'])
 def search_trials():
@@ -22,18 +33,47 @@ def search_trials():
         return jsonify({"error": "Condition parameter is required"}), 400
     
     try:
-        results = TrialAPI.search_trials(condition, location)
-        if isinstance(results, dict) and 'error' in results:
-            return jsonify(results), 500
-        logger.debug(f"API returned {len(results) if isinstance(results, list) else 'error response'}")
-        return jsonify(results)
+        return search_response(TrialAPI.search_trials(condition, location))
     except Exception as e:
         logger.exception("An error occurred during trial search:")
         return jsonify({"error": str(e)}), 500
+
+def search_response(results):
+    """Turn search results from TrialAPI (or its async variant) into a response"""
+    if isinstance(results, dict) and 'error' in results:
+        return jsonify(results), 500
+    logger.debug(f"API returned {len(results) if isinstance(results, list) else 'error response'}")
+    return cached_json_response(results)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "healthy", "message": "API is running"})
 
+def memory_metrics():
+    """Resident and proportional set sizes of this process in kB (Linux only)"""
+    fields = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+    memory = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in fields:
+                    memory[f"{name.lower()}_kb"] = int(value.split()[0])
+    except (OSError, ValueError) as e:
+        logger.debug(f"Memory metrics unavailable: {e}")
+    return memory
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    # cache_loaded_pid differs from pid when the cache was inherited from the master;
+    # a low pss_kb relative to rss_kb shows those pages are still shared
+    return jsonify({
+        "pid": os.getpid(),
+        "startup": startup_metrics,
+        "memory": memory_metrics(),
+        "geocode_cache": get_geocode_cache_stats()
+    })
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 2000))
     app.run(host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,92 @@
+# backend/asgi.py
+# ASGI entry point: serves trial search on the event loop so one worker can
+# wait on many upstream requests at once. Every other route is handed to the
+# Flask app unchanged.
+import logging
+from asgiref.wsgi import WsgiToAsgi
+from flask import request, jsonify
+from werkzeug.test import EnvironBuilder
+from app import app as flask_app, search_response
+from api.trials_async import search_trials_async, close_client, run_in_thread
+
+logger = logging.getLogger(__name__)
+
+wsgi_app = WsgiToAsgi(flask_app)
+
+def path_info(scope):
+    """Return the request path relative to the app's root path"""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    return path or '/'
+
+def build_environ(scope):
+    """Build a WSGI environ for an ASGI HTTP scope so Flask can parse it"""
+    headers = [(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']]
+    host, port = scope.get('server') or ('localhost', None)
+    scheme = scope.get('scheme', 'http')
+    port = port or (443 if scheme == 'https' else 80)
+    if ':' in host:
+        host = f"[{host}]"
+    environ_overrides = {'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}"}
+    if scope.get('client'):
+        environ_overrides['REMOTE_ADDR'] = scope['client'][0]
+        environ_overrides['REMOTE_PORT'] = str(scope['client'][1])
+    return EnvironBuilder(
+        path=path_info(scope),
+        base_url=f"{scheme}://{host}:{port}{scope.get('root_path', '')}",
+        method=scope['method'],
+        query_string=scope['query_string'].decode('latin-1'),
+        headers=headers,
+        environ_overrides=environ_overrides
+    ).get_environ()
+
+async def search_trials(scope, send):
+    # Reuse the Flask request context so CORS, ETags and compression apply as in app.py
+    with flask_app.request_context(build_environ(scope)):
+        condition = request.args.get('condition', '')
+        location = request.args.get('location', '')
+
+        logger.debug(f"Searching trials for condition: {condition}, location: {location}")
+
+        if not condition:
+            rv = jsonify({"error": "Condition parameter is required"}), 400
+        else:
+            try:
+                results = await search_trials_async(condition, location)
+                # Serializing, hashing and compressing large results is CPU-bound
+                rv = await run_in_thread(search_response, results)
+            except Exception as e:
+                logger.exception("An error occurred during trial search:")
+                rv = jsonify({"error": str(e)}), 500
+        response = flask_app.process_response(flask_app.make_response(rv))
+        # Apply the same fixups a WSGI server would (e.g. no Content-Type on 304)
+        headers = response.get_wsgi_headers(request.environ)
+        body = b''.join(response.get_app_iter(request.environ))
+
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in headers.items()]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['method'] == 'GET' and path_info(scope) == '/api/trials/search':
+        await search_trials(scope, send)
+    else:
+        await wsgi_app(scope, receive, send)
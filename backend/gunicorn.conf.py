@@ -0,0 +1,22 @@
+# backend/gunicorn.conf.py
+import gc
+import os
+from dotenv import load_dotenv
+
+# Read .env before any settings so it can set PRELOAD_APP as app.py does
+load_dotenv()
+
+# Import the app in the master so read-only caches are built once and
+# shared copy-on-write with the workers. Set PRELOAD_APP=false to disable.
+preload_app = os.environ.get('PRELOAD_APP', 'true').lower() == 'true'
+
+def when_ready(server):
+    if preload_app:
+        # Workers forked after this inherit the flag via the shared metrics
+        from api.trials import startup_metrics
+        startup_metrics['gunicorn_preload'] = True
+
+        # Move everything allocated during preload into the permanent generation
+        # so the garbage collector does not touch (and copy) those pages in workers
+        gc.freeze()
+        server.log.info(f"Froze {gc.get_freeze_count()} preloaded objects")
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# Compare sync and async search capacity per process against local stand-in upstreams
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from api import trials
+from api.trials import TrialAPI
+from api.trials_async import search_trials_async, close_client
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+UPSTREAM_DELAY = 0.2  # seconds each stand-in upstream call takes
+REQUESTS = 10
+SITES_PER_STUDY = 2
+
+class StandInUpstream(BaseHTTPRequestHandler):
+    """Slow fake of the ClinicalTrials.gov and Google Geocoding APIs"""
+
+    def do_GET(self):
+        time.sleep(UPSTREAM_DELAY)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/studies':
+            # Cities derive from the query so every search geocodes fresh sites
+            term = query['query.term'][0].split(' AND ')[0]
+            body = {'studies': [{
+                'protocolSection': {
+                    'identificationModule': {'nctId': f"NCT{term}{i}", 'briefTitle': f"Study {i}"},
+                    'contactsLocationsModule': {'locations': [
+                        {'facility': {'name': f"Site {j}"}, 'city': f"{term} City {i}-{j}",
+                         'state': 'Massachusetts', 'country': 'United States'}
+                        for j in range(SITES_PER_STUDY)
+                    ]}
+                }
+            } for i in range(5)]}
+        else:
+            seed = sum(map(ord, query['address'][0]))
+            body = {'status': 'OK', 'results': [{
+                'geometry': {'location': {'lat': 42.0 + seed % 100 / 100, 'lng': -71.0 - seed % 50 / 100}},
+                'formatted_address': query['address'][0]
+            }]}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+class StandInServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 stalls concurrent clients on connect
+    request_queue_size = 128
+
+def reset_cache():
+    """Start a cold run with only the user's location cached"""
+    cache = trials.get_geocoding_cache()
+    cache.clear()
+    TrialAPI.geocode_location("Boston, MA")
+
+def run_sync():
+    """Serve requests one at a time, like a single sync gunicorn worker"""
+    start = time.perf_counter()
+    results = [TrialAPI.search_trials(f"condition{i}", "Boston, MA") for i in range(REQUESTS)]
+    return time.perf_counter() - start, results
+
+async def run_async():
+    """Serve all requests concurrently on one event loop"""
+    start = time.perf_counter()
+    results = await asyncio.gather(*(search_trials_async(f"condition{i}", "Boston, MA") for i in range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    await close_client()
+    return elapsed, list(results)
+
+def report(label, sync_elapsed, async_elapsed):
+    logger.warning(f"{label}:")
+    logger.warning(f"  sync:  {sync_elapsed:.2f}s ({REQUESTS / sync_elapsed:.1f} req/s)")
+    logger.warning(f"  async: {async_elapsed:.2f}s ({REQUESTS / async_elapsed:.1f} req/s)")
+    logger.warning(f"  speedup: {sync_elapsed / async_elapsed:.1f}x")
+
+def compare_concurrency():
+    server = StandInServer(('127.0.0.1', 0), StandInUpstream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    TrialAPI.BASE_URL = f"{base}/studies"
+    TrialAPI.GEOCODE_URL = f"{base}/geocode"
+
+    # Keep the real cache file and key out of the benchmark
+    trials.CACHE_FILE = os.path.join(tempfile.mkdtemp(), 'geocoding_cache.pkl')
+    trials.load_environment()
+    trials.GOOGLE_MAPS_API_KEY = 'stand-in'
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # Cold: every site is geocoded, so both paths are bound by the 10/s
+    # Geocoding API rate limit (the sync sleep, the async shared limiter)
+    reset_cache()
+    cold_sync_elapsed, sync_results = run_sync()
+    reset_cache()
+    cold_async_elapsed, async_results = asyncio.run(run_async())
+    assert sync_results == async_results, "sync and async searches returned different trials"
+
+    # Warm: sites are cached, isolating concurrency on the study fetches
+    warm_sync_elapsed, sync_results = run_sync()
+    warm_async_elapsed, async_results = asyncio.run(run_async())
+    assert sync_results == async_results, "sync and async searches returned different trials"
+
+    logger.warning(f"{REQUESTS} searches, {UPSTREAM_DELAY}s per upstream call, "
+                   f"{REQUESTS * 5 * SITES_PER_STUDY} site geocodes when cold")
+    report("cold geocode cache", cold_sync_elapsed, cold_async_elapsed)
+    report("warm geocode cache", warm_sync_elapsed, warm_async_elapsed)
+    server.shutdown()
+
+if __name__ == "__main__":
+    compare_concurrency()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# Check geocode cache keys: equivalent addresses share a key, distinct places never do
+
+import logging
+from api.trials import normalize_address
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Addresses in each group must normalize to the given key
+SAME_KEY = {
+    'boston, ma, united states': [
+        "Boston, MA, United States", "Boston, Massachusetts, United States",
+        " boston ,MA 02115", "02115, Boston, MA", "Boston, Massachusetts 02115, USA",
+    ],
+    'san ramon, ca, united states': ["San Ramon, CA", "San Ramon, California, USA"],
+    'lyon, france': ["Lyon, 69003, France", "Lyon, France"],
+    'tbilisi, georgia': ["Tbilisi, Georgia"],
+}
+
+# Each pair names different locations and must keep different keys
+DIFFERENT_KEYS = [
+    ("12345 Main St, Dallas, TX", "67890 Main St, Dallas, TX"),
+    ("02115, USA", "94103, USA"),
+    ("02115, MA", "01002, MA"),
+    ("75001, France", "13001, France"),
+    ("02115", "94103"),
+    ("Tbilisi, Georgia", "Atlanta, GA"),
+]
+
+def check_normalization():
+    """Check expected keys, collisions and that keys are already canonical"""
+    failures = 0
+    addresses = [a for group in SAME_KEY.values() for a in group]
+    addresses += [a for pair in DIFFERENT_KEYS for a in pair]
+
+    for expected, group in SAME_KEY.items():
+        for address in group:
+            key = normalize_address(address)
+            if key != expected:
+                logger.error(f"{address!r} -> {key!r}, expected {expected!r}")
+                failures += 1
+
+    for first, second in DIFFERENT_KEYS:
+        if normalize_address(first) == normalize_address(second):
+            logger.error(f"{first!r} and {second!r} collide on {normalize_address(first)!r}")
+            failures += 1
+
+    # The cache migration relies on canonical keys normalizing to themselves
+    for address in addresses:
+        key = normalize_address(address)
+        if normalize_address(key) != key:
+            logger.error(f"{key!r} (from {address!r}) is not idempotent: {normalize_address(key)!r}")
+            failures += 1
+
+    if failures:
+        logger.error(f"{failures} normalization checks failed")
+    else:
+        logger.info(f"All normalization checks passed for {len(addresses)} addresses")
+    return failures
+
+if __name__ == "__main__":
+    raise SystemExit(1 if check_normalization() else 0)